@@ -2,75 +2,181 @@ from __future__ import annotations
 
 import json
 import io
+import mmap
+import os
 import re
 import sys
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
 from queue import Queue
 from re import Pattern
 from threading import Thread
+from typing import BinaryIO, Callable, Iterator
 
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
 
-def process_file(
-    filename: str, pattern: Pattern[bytes], multiline: bool, negate: bool, queue: Queue
-) -> None:
+# Set in every worker process by `_init_worker`, so that tasks only need to carry
+# the filename instead of pickling the compiled pattern each time.
+_pattern: Pattern[bytes]
+_scan: Callable[[Pattern[bytes], str], tuple[int, bytes]]
+
+_COUNT_CHUNK_SIZE = 1 << 20
+
+# Starting worker processes takes tens of milliseconds (much more when they have to
+# spawn a new interpreter), which dwarfs scanning a handful of changed files. Only
+# inputs at least this large are scanned in a process pool, smaller ones are
+# scanned by threads in this process.
+_PROCESS_POOL_MIN_FILES = 64
+_PROCESS_POOL_MIN_BYTES = 4 << 20
+
+
+def _init_worker(pattern: bytes, flags: int, multiline: bool, negate: bool) -> None:
+    global _pattern, _scan
+    _pattern = re.compile(pattern, flags)
+    # The mode is fixed for the whole run, so pick the scanner once per worker
+    # rather than branching on every file.
+    if multiline:
+        if negate:
+            _scan = _process_filename_at_once_negated
+        else:
+            _scan = _process_filename_at_once
+    else:
+        anchor = _required_literal(_pattern)
+        if negate:
+            _scan = partial(_process_filename_by_line_negated, anchor=anchor)
+        else:
+            _scan = partial(_process_filename_by_line, anchor=anchor)
+
+
+def _required_literal(pattern: Pattern[bytes]) -> bytes:
+    """
+    Return the longest run of literal bytes that every match of `pattern` must
+    contain, or `b""` if there is none.
+
+    Only literals at the top level of the parsed pattern are used. The parser
+    already inlines non-capturing groups without flags and hoists a prefix shared
+    by all alternatives out of a branch, so those literals count as top level.
+    Capturing groups, groups with scoped flags such as `(?i:...)`, branches,
+    repeats and lookarounds are skipped, since they may be optional or match
+    differently. Patterns compiled with `re.IGNORECASE` are skipped because a
+    plain substring check would miss other casings. Patterns that start with a
+    literal are skipped too: `re` already searches for a literal prefix on its
+    own, so the extra check would only add overhead.
+    """
+    if pattern.flags & re.IGNORECASE:
+        return b""
     try:
-        if multiline:
-            if negate:
-                ret, output = _process_filename_at_once_negated(pattern, filename)
-            else:
-                ret, output = _process_filename_at_once(pattern, filename)
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        # The parser is a private module, do not fail the hook if it changes.
+        return b""
+    if not parsed or parsed[0][0] == sre_parse.LITERAL:
+        return b""
+
+    longest = current = b""
+    for op, value in parsed:
+        if op == sre_parse.LITERAL:
+            current += bytes((value,))
+            if len(current) > len(longest):
+                longest = current
         else:
-            if negate:
-                ret, output = _process_filename_by_line_negated(pattern, filename)
-            else:
-                ret, output = _process_filename_by_line(pattern, filename)
-        queue.put((ret, output))
+            current = b""
+    return longest
+
+
+def process_file(filename: str) -> tuple[int, bytes]:
+    try:
+        return _scan(_pattern, filename)
     except Exception as e:
-        # Put error result in queue so consumer can handle it
-        queue.put((1, f"Error processing {filename}: {e}\n".encode()))
+        return 1, f"Error processing {filename}: {e}\n".encode()
 
 
 def _process_filename_by_line(
-    pattern: Pattern[bytes], filename: str
+    pattern: Pattern[bytes], filename: str, anchor: bytes = b""
 ) -> tuple[int, bytes]:
     retv = 0
     output = io.BytesIO()
+    prefix = filename.encode() + b":"
     with open(filename, "rb") as f:
         for line_no, line in enumerate(f, start=1):
+            # A substring search is much cheaper than running the regex, and a line
+            # without the required literal cannot match. `find` is used because it
+            # is noticeably faster than `in` for short lines.
+            if anchor and line.find(anchor) == -1:
+                continue
             if pattern.search(line):
                 retv = 1
-                output.write(f"{filename}:{line_no}:".encode())
-                output.write(line.rstrip(b"\r\n"))
-                output.write(b"\n")
+                output.write(b"%s%d:%s\n" % (prefix, line_no, line.rstrip(b"\r\n")))
     return retv, output.getvalue()
 
 
+@contextmanager
+def _map_file(f: BinaryIO) -> Iterator[bytes | mmap.mmap]:
+    """
+    Map the whole file into memory, so the regex scans the page cache directly
+    instead of a copy of the file. `mmap` refuses empty files, which are
+    still searched as `b""` because patterns like `^$` can match them.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        yield b""
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+        yield contents
+
+
+def _count_newlines(contents: bytes | mmap.mmap, end: int) -> int:
+    """
+    Count the newlines before `end`. The prefix is sliced in fixed-size chunks,
+    because `mmap` has no `count()` and copying the whole prefix out of a large
+    file would cost as much memory as reading it.
+    """
+    count = 0
+    for pos in range(0, end, _COUNT_CHUNK_SIZE):
+        count += contents[pos : min(pos + _COUNT_CHUNK_SIZE, end)].count(b"\n")
+    return count
+
+
 def _process_filename_at_once(
     pattern: Pattern[bytes], filename: str
 ) -> tuple[int, bytes]:
     retv = 0
     output = io.BytesIO()
-    with open(filename, "rb") as f:
-        contents = f.read()
+    with open(filename, "rb") as f, _map_file(f) as contents:
         match = pattern.search(contents)
         if match:
             retv = 1
-            line_no = contents[: match.start()].count(b"\n")
+            start = match.start()
+            line_no = _count_newlines(contents, start)
             output.write(f"{filename}:{line_no + 1}:".encode())
 
-            matched_lines = match[0].split(b"\n")
-            matched_lines[0] = contents.split(b"\n")[line_no]
-
-            output.write(b"\n".join(matched_lines))
+            # Report the whole first line, followed by the rest of the match if it
+            # spans multiple lines, as one slice of the file.
+            line_start = contents.rfind(b"\n", 0, start) + 1
+            line_end = contents.find(b"\n", start)
+            if line_end == -1:
+                line_end = len(contents)
+            output.write(contents[line_start : max(line_end, match.end())])
             output.write(b"\n")
     return retv, output.getvalue()
 
 
 def _process_filename_by_line_negated(
-    pattern: Pattern[bytes], filename: str
+    pattern: Pattern[bytes], filename: str, anchor: bytes = b""
 ) -> tuple[int, bytes]:
     with open(filename, "rb") as f:
         for line in f:
+            if anchor and line.find(anchor) == -1:
+                continue
             if pattern.search(line):
                 return 0, b""
         else:
@@ -80,38 +186,98 @@ def _process_filename_by_line_negated(
 def _process_filename_at_once_negated(
     pattern: Pattern[bytes], filename: str
 ) -> tuple[int, bytes]:
-    with open(filename, "rb") as f:
-        contents = f.read()
-    match = pattern.search(contents)
+    with open(filename, "rb") as f, _map_file(f) as contents:
+        match = pattern.search(contents)
     if match:
         return 0, b""
     else:
         return 1, filename.encode() + b"\n"
 
 
+def _read_filenames() -> Iterator[str]:
+    for line in sys.stdin:
+        # Only strip the line ending, filenames may start or end with spaces
+        filename = line.rstrip("\r\n")
+        if not filename:
+            break
+        yield filename
+
+
+def _file_size(filename: str) -> int:
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        # Let the worker report the error
+        return 0
+
+
 def run(
     ignore_case: bool, multiline: bool, negate: bool, concurrency: int, pattern: bytes
 ):
     flags = re.IGNORECASE if ignore_case else 0
     if multiline:
         flags |= re.MULTILINE | re.DOTALL
-    pattern = re.compile(pattern, flags)
+    # Set up this process as a worker too: an invalid pattern is reported before any
+    # worker process is started, and small inputs are scanned here by threads.
+    _init_worker(pattern, flags, multiline, negate)
+
+    if sys.platform == "win32":
+        # `ProcessPoolExecutor` refuses more than 61 workers on Windows.
+        concurrency = min(concurrency, 61)
 
     queue = Queue()
-    pool = ThreadPoolExecutor(max_workers=concurrency)
 
     # Use a sentinel value to signal completion
     SENTINEL = (None, None)
 
+    def create_pool(filenames: list[str]) -> Executor:
+        workers = max(1, min(concurrency, len(filenames)))
+        sizes = {}
+        if len(filenames) >= _PROCESS_POOL_MIN_FILES:
+            sizes = {filename: _file_size(filename) for filename in filenames}
+        if sum(sizes.values()) < _PROCESS_POOL_MIN_BYTES:
+            return ThreadPoolExecutor(max_workers=workers)
+
+        # Submit the largest files first, so a big file picked up last does not
+        # keep one worker busy after all the others have finished.
+        if len(filenames) > workers:
+            filenames.sort(key=sizes.__getitem__, reverse=True)
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(pattern, flags, multiline, negate),
+        )
+
+    def submit(pool: Executor, filename: str) -> None:
+        def on_done(future: Future) -> None:
+            try:
+                queue.put(future.result())
+            except Exception as e:
+                # The worker process died, e.g. it was killed
+                queue.put((1, f"Error processing {filename}: {e}\n".encode()))
+
+        try:
+            future = pool.submit(process_file, filename)
+        except BrokenProcessPool as e:
+            # A worker died before all files were submitted, the pool accepts no
+            # more work
+            queue.put((1, f"Error processing {filename}: {e}\n".encode()))
+            return
+        future.add_done_callback(on_done)
+
     def producer():
         try:
-            for line in sys.stdin:
-                line = line.strip()
-                if not line:
-                    break
-                pool.submit(
-                    process_file, line.strip(), pattern, multiline, negate, queue
-                )
+            if concurrency <= 1:
+                # A single worker needs no pool sizing or scheduling, so scan files
+                # as they arrive instead of waiting for the whole list.
+                pool = ThreadPoolExecutor(max_workers=1)
+                for filename in _read_filenames():
+                    submit(pool, filename)
+            else:
+                filenames = list(_read_filenames())
+                pool = create_pool(filenames)
+                for filename in filenames:
+                    submit(pool, filename)
 
             # Wait for all tasks to complete
             pool.shutdown(wait=True)
@@ -132,13 +298,17 @@ def run(
 
                 retv |= ret
                 if output:
+                    # Each result is the complete output of one file and only this
+                    # thread writes to stdout, so there is no interleaving. Nothing
+                    # reads stdout before we exit, so let the buffer batch writes.
                     sys.stdout.buffer.write(output)
-                    sys.stdout.buffer.flush()
 
                 queue.task_done()
         except Exception:
             pass
 
+        sys.stdout.buffer.flush()
+
         # Write final return code
         sys.stderr.buffer.write(f'{{"code": {retv}}}\n'.encode())
         sys.stderr.buffer.flush()
@@ -446,3 +446,269 @@ fn invalid_args() -> Result<()> {
 
     Ok(())
 }
+
+/// Test patterns whose required literal is used to skip lines before running the regex.
+/// Each hook has a line that contains the literal and matches, and one that contains it
+/// but does not match.
+#[test]
+fn required_literal_prescan() -> Result<()> {
+    let context = TestContext::new();
+    context.init_project();
+
+    let cwd = context.work_dir();
+    cwd.child("mixed.txt")
+        .write_str("fix this TODO later\n123 TODO\nnothing to see\nx TODO\n")?;
+    cwd.child("near_miss.txt")
+        .write_str("123 TODO\nnothing to see\n")?;
+    cwd.child("scoped.txt").write_str("fix todo\n123 TODO\n")?;
+    cwd.child("alternation.txt").write_str("a fob\nfob\n")?;
+    cwd.child("lookbehind.txt").write_str("a foo\nxfoo\n")?;
+
+    context.write_pre_commit_config(indoc::indoc! {r#"
+        repos:
+          - repo: local
+            hooks:
+              - id: word-todo
+                name: word-todo
+                language: pygrep
+                entry: "[a-z]+ TODO"
+                files: "^mixed\\.txt$"
+              - id: no-word-todo
+                name: no-word-todo
+                language: pygrep
+                entry: "[a-z]+ TODO"
+                args: ["--negate"]
+                files: "^(mixed|near_miss)\\.txt$"
+              - id: scoped-ignore-case
+                name: scoped-ignore-case
+                language: pygrep
+                entry: "[a-z]+ (?i:TODO)"
+                files: "^scoped\\.txt$"
+              - id: common-prefix
+                name: common-prefix
+                language: pygrep
+                entry: ".foo|.fob"
+                files: "^alternation\\.txt$"
+              - id: lookbehind
+                name: lookbehind
+                language: pygrep
+                entry: "(?<!x)foo"
+                files: "^lookbehind\\.txt$"
+        "#});
+    context.git_add(".");
+
+    cmd_snapshot!(context.filters(), context.run(), @r"
+    success: false
+    exit_code: 1
+    ----- stdout -----
+    word-todo................................................................Failed
+    - hook id: word-todo
+    - exit code: 1
+
+      mixed.txt:1:fix this TODO later
+      mixed.txt:4:x TODO
+    no-word-todo.............................................................Failed
+    - hook id: no-word-todo
+    - exit code: 1
+
+      near_miss.txt
+    scoped-ignore-case.......................................................Failed
+    - hook id: scoped-ignore-case
+    - exit code: 1
+
+      scoped.txt:1:fix todo
+    common-prefix............................................................Failed
+    - hook id: common-prefix
+    - exit code: 1
+
+      alternation.txt:1:a fob
+    lookbehind...............................................................Failed
+    - hook id: lookbehind
+    - exit code: 1
+
+      lookbehind.txt:1:a foo
+
+    ----- stderr -----
+    ");
+
+    Ok(())
+}
+
+/// Test that spaces around and inside filenames are kept
+#[test]
+fn filename_with_spaces() -> Result<()> {
+    let context = TestContext::new();
+    context.init_project();
+
+    let cwd = context.work_dir();
+    cwd.child(" spaced .txt")
+        .write_str("TODO: handle spaces\n")?;
+
+    context.write_pre_commit_config(indoc::indoc! {r#"
+        repos:
+          - repo: local
+            hooks:
+              - id: check-todo
+                name: check-todo
+                language: pygrep
+                entry: "TODO"
+                files: "\\.txt$"
+        "#});
+    context.git_add(".");
+
+    cmd_snapshot!(context.filters(), context.run(), @r"
+    success: false
+    exit_code: 1
+    ----- stdout -----
+    check-todo...............................................................Failed
+    - hook id: check-todo
+    - exit code: 1
+
+       spaced .txt:1:TODO: handle spaces
+
+    ----- stderr -----
+    ");
+
+    Ok(())
+}
+
+/// Test that multiline mode still searches empty files, which cannot be memory-mapped
+#[test]
+fn multiline_empty_file() -> Result<()> {
+    let context = TestContext::new();
+    context.init_project();
+
+    let cwd = context.work_dir();
+    cwd.child("empty.txt").touch()?;
+    cwd.child("content.txt").write_str("content")?;
+
+    context.write_pre_commit_config(indoc::indoc! {r#"
+        repos:
+          - repo: local
+            hooks:
+              - id: check-empty
+                name: check-empty
+                language: pygrep
+                entry: "^$"
+                args: ["--multiline"]
+                files: "\\.txt$"
+        "#});
+    context.git_add(".");
+
+    cmd_snapshot!(context.filters(), context.run(), @r"
+    success: false
+    exit_code: 1
+    ----- stdout -----
+    check-empty..............................................................Failed
+    - hook id: check-empty
+    - exit code: 1
+
+      empty.txt:1:
+
+    ----- stderr -----
+    ");
+
+    Ok(())
+}
+
+/// Test an input large enough to be scanned by a pool of worker processes
+#[test]
+fn process_pool() -> Result<()> {
+    let context = TestContext::new();
+    context.init_project();
+
+    // The script only starts worker processes for at least 64 files totalling at
+    // least 4 MiB, and only when there is more than one CPU. Smaller inputs are
+    // scanned by threads.
+    let cwd = context.work_dir();
+    let filler = "nothing to see here\n".repeat(3277);
+
+    // prek shuffles filenames with a fixed seed before a hook runs (see
+    // `HookRunInput::shuffle`). Repeat that shuffle to find the file that reaches the
+    // script last, and make it the largest one, so the size-descending sort has to
+    // move it to the front.
+    let mut order: Vec<usize> = (0..70).collect();
+    fastrand::Rng::with_seed(1_542_676_187).shuffle(&mut order);
+    let large = order[order.len() - 1];
+    let large_name = format!("file_{large:02}.txt");
+
+    for i in 0..70 {
+        let contents = if i == large {
+            format!("{}TODO: scanned last\n", filler.repeat(16))
+        } else {
+            filler.clone()
+        };
+        cwd.child(format!("file_{i:02}.txt")).write_str(&contents)?;
+    }
+    cwd.child("fixme.txt")
+        .write_str(&format!("FIXME: look at this\nlater\n{filler}"))?;
+    cwd.child("other.txt")
+        .write_str(&"other content\n".repeat(4682))?;
+
+    context.write_pre_commit_config(indoc::indoc! {r#"
+        repos:
+          - repo: local
+            hooks:
+              - id: check-todo
+                name: check-todo
+                language: pygrep
+                entry: "TODO"
+                files: "^file_\\d+\\.txt$"
+              - id: check-fixme
+                name: check-fixme
+                language: pygrep
+                entry: 'FIXME[^\n]*\nlater'
+                args: ["--multiline"]
+                files: "\\.txt$"
+              - id: require-filler
+                name: require-filler
+                language: pygrep
+                entry: "nothing to see"
+                args: ["--negate"]
+                files: "\\.txt$"
+              - id: require-filler-multiline
+                name: require-filler-multiline
+                language: pygrep
+                entry: 'see here\nnothing'
+                args: ["--multiline", "--negate"]
+                files: "\\.txt$"
+        "#});
+    context.git_add(".");
+
+    let filters = context
+        .filters()
+        .into_iter()
+        .chain([(large_name.as_str(), "[LARGE]")])
+        .collect::<Vec<_>>();
+
+    cmd_snapshot!(filters, context.run(), @r"
+    success: false
+    exit_code: 1
+    ----- stdout -----
+    check-todo...............................................................Failed
+    - hook id: check-todo
+    - exit code: 1
+
+      [LARGE]:52433:TODO: scanned last
+    check-fixme..............................................................Failed
+    - hook id: check-fixme
+    - exit code: 1
+
+      fixme.txt:1:FIXME: look at this
+      later
+    require-filler...........................................................Failed
+    - hook id: require-filler
+    - exit code: 1
+
+      other.txt
+    require-filler-multiline.................................................Failed
+    - hook id: require-filler-multiline
+    - exit code: 1
+
+      other.txt
+
+    ----- stderr -----
+    ");
+
+    Ok(())
+}
@@ -20,7 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import functools
 import os
+import re
 import sys
 import sysconfig
 
@@ -28,8 +30,14 @@ import sysconfig
 class PrekNotFound(FileNotFoundError): ...
 
 
+@functools.cache
 def find_prek_bin() -> str:
-    """Return the prek binary path."""
+    """
+    Return the prek binary path.
+
+    The result is cached for the lifetime of the process. A failed lookup raises
+    `PrekNotFound` without being cached, so a later call searches again.
+    """
 
     prek_exe = "prek" + sysconfig.get_config_var("EXE")
 
@@ -55,18 +63,23 @@ def find_prek_bin() -> str:
         sysconfig.get_path("scripts", scheme=_user_scheme()),
     ]
 
-    seen = []
+    searched = []
+    seen = set()
     for target in targets:
         if not target:
             continue
-        if target in seen:
+        # Compare normalized paths so that e.g. `C:\Python\Scripts` and
+        # `c:/python/scripts/` are only checked once on Windows.
+        key = os.path.normcase(os.path.normpath(target))
+        if key in seen:
             continue
-        seen.append(target)
+        seen.add(key)
+        searched.append(target)
         path = os.path.join(target, prek_exe)
         if os.path.isfile(path):
             return path
 
-    locations = "\n".join(f" - {target}" for target in seen)
+    locations = "\n".join(f" - {target}" for target in searched)
     raise PrekNotFound(
         f"Could not find the prek binary in any of the following locations:\n{locations}\n"
     )
@@ -82,25 +95,33 @@ def _matching_parents(path: str | None, match: str) -> str | None:
     Return the parent directory of `path` after trimming a `match` from the end.
     The match is expected to contain `/` as a path separator, while the `path`
     is expected to use the platform's path separator (e.g., `os.sep`). The path
-    components are compared case-insensitively and a `*` wildcard can be used
-    in the `match`.
+    components are compared case-insensitively and `*` and `?` wildcards can be
+    used in the `match`.
     """
-    from fnmatch import fnmatch
-
     if not path:
         return None
     parts = path.split(os.sep)
-    match_parts = match.split("/")
-    if len(parts) < len(match_parts):
+    depth = match.count("/") + 1
+    if len(parts) < depth:
         return None
 
-    if not all(
-        fnmatch(part, match_part)
-        for part, match_part in zip(reversed(parts), reversed(match_parts))
-    ):
+    tail = "/".join(parts[-depth:])
+    if not _compile_match(match).fullmatch(tail):
         return None
 
-    return os.sep.join(parts[: -len(match_parts)])
+    return os.sep.join(parts[:-depth])
+
+
+@functools.cache
+def _compile_match(match: str) -> re.Pattern[str]:
+    """
+    Compile a `/`-separated `match` into a single regex. Wildcards never cross a
+    `/`, so each pattern component still lines up with exactly one path component.
+    """
+    regex = "".join(
+        "[^/]*" if c == "*" else "[^/]" if c == "?" else re.escape(c) for c in match
+    )
+    return re.compile(regex, re.IGNORECASE)
 
 
 def _join(path: str | None, *parts: str) -> str | None: